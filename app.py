@@ -1,26 +1,136 @@
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, session
+from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, session, g, abort, has_request_context
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.utils import secure_filename
-import json
+from werkzeug.security import safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import hashlib
-from datetime import datetime
+import hmac
+from datetime import datetime, timezone
+from functools import wraps
+from collections.abc import Mapping
+from bisect import bisect_left, insort
+import threading
 import re # Added for validation
+import time
+import gzip
+import math
+
+import metrics
+import profiling
+from ratelimit import InFlight, TokenBucketLimiter, retry_after_header
+from storage import (USERS_FILE, CHAT_HISTORY_FILE, DEFAULT_FORMAT, check_format,
+                     read_data_file, write_data_file, get_default_prefs,
+                     new_user_record, migrate_user, migrate_records)
+
+# brotli is optional and deliberately not in requirements.txt (it needs a C
+# build on some platforms); without it cached pages are only served gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # OpenCV imports are placed inside the detect_objects function
 # to avoid dependency issues if not installed globally.
 
-app = Flask(__name__)
+# Static responses requested through a versioned URL (?v=<content hash>, added
+# by url_for) are cached by browsers for a year; others revalidate via ETag
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+class App(Flask):
+    def get_send_file_max_age(self, filename):
+        if has_request_context() and request.endpoint == 'static' and request.args.get('v'):
+            return STATIC_MAX_AGE
+        return super().get_send_file_max_age(filename)
+
+app = App(__name__)
 app.secret_key = 'your-secret-key-here'  # Change this in production
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# File to store user data
-USERS_FILE = 'users.json'
-CHAT_HISTORY_FILE = 'chat_history.json'
+# Number of reverse proxies in front of the app. When set, the client address
+# (used to key anonymous rate limits) is taken from X-Forwarded-For instead of
+# the proxy's own address. Leave at 0 when clients connect directly, or they
+# could spoof the header.
+app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+if app.config['TRUSTED_PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+
+# Instrumentation is off unless METRICS_ENABLED=1; this must be set before the
+# @metrics.timed decorators below run, as they are no-ops when disabled
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+metrics.enabled = app.config['METRICS_ENABLED']
+# /metrics requires 'Authorization: Bearer <METRICS_TOKEN>'; with no token set it stays closed
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# Rooms exported by name; all other rooms (per-player, client-named) are summed as 'other'
+METRICS_ROOMS = ('unified_chat', 'leaderboard')
+
+# Sampling profiler; can also be toggled at runtime through /admin/profiling
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+# /admin/profiling requires 'Authorization: Bearer <PROFILING_TOKEN>'; with no token set it stays closed
+app.config['PROFILING_TOKEN'] = os.environ.get('PROFILING_TOKEN', '')
+if os.environ.get('PROFILING_ENABLED', '0') == '1':
+    profiling.start(float(os.environ.get('PROFILE_SAMPLE_RATE', profiling.sample_rate)))
+
+# Serializer used when writing users/chat files: JSON unless STORAGE_FORMAT=msgpack.
+# Files are auto-detected on load, so switching formats needs no migration.
+# Checked here because save_users() swallows errors and would drop every write.
+app.config['STORAGE_FORMAT'] = check_format(DEFAULT_FORMAT)
+
+# Validators compiled once at import instead of on every request
+HEX_COLOR_RE = re.compile(r'^#([0-9a-f]{6}|[0-9a-f]{3})$')
+USERNAME_RE = re.compile(r'^[a-zA-Z0-9_]{3,20}$')
+
+# Per-route request budgets: (tokens per second, burst), keyed by username or IP
+RATE_LIMITS = {
+    'click': (20, 40),
+    'upgrade': (5, 10),
+    'detect': (5, 10),
+}
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+# Shed load with 429s once this many detections / clicker updates are already
+# running. A clicker update is counted for its whole load-modify-save, since the
+# file write alone is too short to ever pile up.
+app.config['LOAD_SHEDDING_ENABLED'] = os.environ.get('LOAD_SHEDDING_ENABLED', '1') == '1'
+app.config['DETECT_MAX_IN_FLIGHT'] = int(os.environ.get('DETECT_MAX_IN_FLIGHT', 4))
+app.config['STORAGE_MAX_IN_FLIGHT'] = int(os.environ.get('STORAGE_MAX_IN_FLIGHT', 8))
+rate_limiter = TokenBucketLimiter(RATE_LIMITS)
+detect_in_flight = InFlight()
+storage_in_flight = InFlight()
+
+# Set WARMUP_ON_STARTUP=1 to pre-import OpenCV and preload cascades in the
+# background at boot; otherwise the first /ready probe starts the warm-up
+app.config['WARMUP_ON_STARTUP'] = os.environ.get('WARMUP_ON_STARTUP', '0') == '1'
+
+# Seconds spent in each startup/warm-up phase, reported by /ready
+startup_profile = {}
+warmup_state = {'status': 'pending'}  # pending -> running -> ready, or failed
+warmup_lock = threading.Lock()
+
+# Public pages are rendered once per deploy and served from memory
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+# Static file path -> ((mtime, size), content hash) for versioned static URLs
+static_versions = {}
+
+# Cached page views: endpoint -> view function, and endpoint -> rendered entry
+cached_page_views = {}
+page_cache = {}
 
 # In-memory chat storage (will also persist to file)
 chat_messages = []
 
+# Leaderboard index: (-clicks, username) tuples kept sorted, best player first.
+# leaderboard_clicks remembers each user's indexed score so entries can be found.
+leaderboard = []
+leaderboard_clicks = {}
+leaderboard_lock = threading.Lock()
+LEADERBOARD_SIZE = 10
+# Changes are pushed to watchers at most this often (seconds), coalescing click bursts
+LEADERBOARD_PUSH_INTERVAL = 1.0
+# Socket.IO sid -> username for signed-in clients that sent watch_leaderboard
+leaderboard_watchers = {}
+# Bumped on every index change; the pusher skips intervals where it did not move
+leaderboard_state = {'version': 0, 'pusher_started': False}
+
 # File upload configuration
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -33,63 +143,250 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 
+@metrics.timed('storage_operation_seconds', operation='load_users')
 def load_users():
-    """Load users from JSON file"""
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r') as f:
-                content = f.read().strip()
-                if not content:
-                    return {}
-                return json.loads(content)
-        except (json.JSONDecodeError, ValueError):
-            # If file is corrupted, return empty dict
-            print("Warning: users.json is corrupted, returning empty user dict")
-            return {}
-    return {}
+    """Load users from the users file"""
+    try:
+        return read_data_file(USERS_FILE, {})
+    except ValueError:
+        # If file is corrupted, return empty dict
+        print("Warning: users.json is corrupted, returning empty user dict")
+        return {}
 
+@metrics.timed('storage_operation_seconds', operation='save_users')
 def save_users(users):
-    """Save users to JSON file"""
+    """Save users to the users file; returns whether the write succeeded"""
     try:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, indent=2)
-            f.flush()  # Ensure data is written to disk
+        write_data_file(USERS_FILE, users, app.config['STORAGE_FORMAT'])
     except Exception as e:
         print(f"Error saving users: {e}")
+        return False
+    return True
 
 def hash_password(password):
     """Simple password hashing"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+@metrics.timed('storage_operation_seconds', operation='load_chat_history')
 def load_chat_history():
-    """Load chat history from JSON file"""
+    """Load chat history from the chat history file"""
     global chat_messages
-    if os.path.exists(CHAT_HISTORY_FILE):
-        with open(CHAT_HISTORY_FILE, 'r') as f:
-            chat_messages = json.load(f)
-    else:
-        chat_messages = []
+    chat_messages = read_data_file(CHAT_HISTORY_FILE, [])
     return chat_messages
 
+@metrics.timed('storage_operation_seconds', operation='save_chat_history')
 def save_chat_history():
-    """Save chat history to JSON file"""
-    with open(CHAT_HISTORY_FILE, 'w') as f:
-        json.dump(chat_messages, f, indent=2)
+    """Save chat history to the chat history file"""
+    write_data_file(CHAT_HISTORY_FILE, chat_messages, app.config['STORAGE_FORMAT'])
 
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_default_prefs():
-    """Get default user preferences"""
-    return {
-        'welcome_text': 'Welcome to the website made by your ideas!',
-        'bg_color': '#f5f5f5',
-        'text_color': '#333333',
-        'font_size': '16',
-        'bg_image': None
-    }
+def migrate_users():
+    """Bring every stored user up to the current schema in one pass; returns the users"""
+    users = load_users()
+    if migrate_records(users):
+        save_users(users)
+    return users
+
+def rebuild_leaderboard(users):
+    """Rebuild the leaderboard index from stored users"""
+    with leaderboard_lock:
+        # .get: with MIGRATE_ON_STARTUP=0 records may not be migrated yet
+        leaderboard_clicks.clear()
+        leaderboard_clicks.update((name, record.get('clicks', 0)) for name, record in users.items())
+        leaderboard[:] = sorted((-clicks, name) for name, clicks in leaderboard_clicks.items())
+        leaderboard_state['version'] += 1
+
+def get_rank(username):
+    """1-based rank of a user, or None if they are not on the leaderboard"""
+    clicks = leaderboard_clicks.get(username)
+    if clicks is None:
+        return None
+    return bisect_left(leaderboard, (-clicks, username)) + 1
+
+def get_leaderboard_entries(start, stop):
+    """Leaderboard rows for 0-based positions start..stop"""
+    return [{'rank': i + 1, 'username': name, 'clicks': -neg_clicks}
+            for i, (neg_clicks, name) in enumerate(leaderboard[start:stop], start)]
+
+def update_leaderboard(username, clicks):
+    """Move a user to their new position; returns their rank.
+
+    Watchers are notified by leaderboard_pusher(), not from here.
+    """
+    with leaderboard_lock:
+        old_clicks = leaderboard_clicks.get(username)
+        if old_clicks != clicks:
+            if old_clicks is not None:
+                del leaderboard[get_rank(username) - 1]
+            insort(leaderboard, (-clicks, username))
+            leaderboard_clicks[username] = clicks
+            leaderboard_state['version'] += 1
+        return get_rank(username)
+
+def push_leaderboard_changes(pushed):
+    """Emit what changed since the last push recorded in `pushed`.
+
+    The top N goes to the whole leaderboard room. Each signed-in watcher whose
+    rank moved gets a rank_update, including players who were overtaken.
+    """
+    with leaderboard_lock:
+        top = get_leaderboard_entries(0, LEADERBOARD_SIZE)
+        ranks = {name: get_rank(name) for name in set(leaderboard_watchers.values())}
+
+    if top != pushed.get('top'):
+        socketio.emit('leaderboard_update', {'top': top}, room='leaderboard')
+        pushed['top'] = top
+    pushed_ranks = pushed.get('ranks', {})
+    for name, rank in ranks.items():
+        if pushed_ranks.get(name) != rank:
+            socketio.emit('rank_update', {'rank': rank}, room=f'leaderboard_{name}')
+    pushed['ranks'] = ranks
+
+def leaderboard_pusher():
+    """Background task coalescing leaderboard changes into one push per interval"""
+    pushed = {}
+    last_version = None
+    while True:
+        socketio.sleep(LEADERBOARD_PUSH_INTERVAL)
+        # Also push when the watcher set changed, so newcomers' ranks are tracked
+        version = (leaderboard_state['version'], len(leaderboard_watchers))
+        if version != last_version:
+            # A failed push must not end the task (pusher_started keeps it from
+            # being restarted); it is retried on the next tick instead
+            try:
+                push_leaderboard_changes(pushed)
+            except Exception as e:
+                print(f"Error pushing leaderboard updates: {e}")
+                continue
+            last_version = version
+
+def start_leaderboard_pusher():
+    with leaderboard_lock:
+        if leaderboard_state['pusher_started']:
+            return
+        leaderboard_state['pusher_started'] = True
+    socketio.start_background_task(leaderboard_pusher)
+
+def profile_startup(phase, func, *args):
+    """Run one startup phase, recording how long it took"""
+    start = time.perf_counter()
+    result = func(*args)
+    # The warm-up thread writes here while /ready may be reading
+    with warmup_lock:
+        startup_profile[phase] = round(time.perf_counter() - start, 4)
+    return result
+
+def static_file_version(filename):
+    """Short content hash of a static file, recomputed only when it changes"""
+    path = safe_join(app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = static_versions.get(path)
+    if cached is None or cached[0] != key:
+        with open(path, 'rb') as f:
+            cached = static_versions[path] = (key, hashlib.sha1(f.read()).hexdigest()[:12])
+    return cached[1]
+
+@app.url_defaults
+def add_static_version(endpoint, values):
+    # Replaced files (including re-uploaded backgrounds) get a new URL, so
+    # the long max-age never serves stale content after a deploy
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        version = static_file_version(values['filename'])
+        if version:
+            values['v'] = version
+
+def cached_page(f):
+    """Serve a visitor-independent page from the pre-rendered page cache"""
+    if not app.config['PAGE_CACHE_ENABLED']:
+        return f
+    cached_page_views[f.__name__] = f
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        entry = page_cache.get(f.__name__)
+        # Flashed messages are rendered into the page, so those visits render live
+        if entry is None or '_flashes' in session:
+            return f(*args, **kwargs)
+        return serve_cached_page(entry)
+    return wrapper
+
+def prerender_pages():
+    """Render every cached page once and store its compressed variants"""
+    last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+    for endpoint, view in cached_page_views.items():
+        try:
+            with app.test_request_context():
+                path = url_for(endpoint)
+            with app.test_request_context(path):
+                body = view().encode('utf-8')
+        except Exception as e:
+            # Leave it uncached; the live route reports the problem per request
+            print(f"Could not pre-render {endpoint}: {e}")
+            continue
+        variants = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(body)
+        page_cache[endpoint] = {
+            'variants': variants,
+            'etag': hashlib.sha1(body).hexdigest()[:16],
+            'last_modified': last_modified,
+        }
+
+def serve_cached_page(entry):
+    """Build a response for a cached page, honouring Accept-Encoding and validators"""
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in entry['variants'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    response = app.response_class(entry['variants'][encoding], mimetype='text/html')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Each encoding is a different representation, so it needs its own ETag
+    response.set_etag(f"{entry['etag']}-{encoding}")
+    response.last_modified = entry['last_modified']
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def rate_limited(budget, in_flight=None, max_in_flight=None):
+    """Reject requests over the caller's budget, or all of them once the view is
+    already running max_in_flight times (the app.config key) across callers"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Per-caller budgets and overload shedding are switched independently
+            retry_after, reason = 0, None
+            if app.config['RATE_LIMIT_ENABLED']:
+                key = session.get('username') or request.remote_addr
+                retry_after = rate_limiter.acquire(budget, key)
+                reason = 'rate_limit' if retry_after else None
+            if not reason and in_flight is not None:
+                # Check and count in one step, so a burst can't all slip in under the limit
+                limit = app.config[max_in_flight] if app.config['LOAD_SHEDDING_ENABLED'] else math.inf
+                if not in_flight.try_enter(limit):
+                    retry_after, reason = 1, 'overload'
+            if reason:
+                metrics.inc('requests_rejected_total', budget=budget, reason=reason)
+                response = jsonify({'error': 'Too many requests, please slow down.'})
+                response.headers['Retry-After'] = retry_after_header(retry_after)
+                return response, 429
+            if in_flight is None:
+                return f(*args, **kwargs)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                in_flight.leave()
+        return wrapper
+    return decorator
 
 def get_user_prefs(username):
     """Get user preferences with defaults"""
@@ -126,7 +423,7 @@ def validate_prefs(form):
     bg_color = form.get('bg_color', '').strip().lower()
     if not bg_color:
         errors.append('Background color is required')
-    elif not re.match(r'^#([0-9a-f]{6}|[0-9a-f]{3})$', bg_color):
+    elif not HEX_COLOR_RE.match(bg_color):
         errors.append('Background color must be a valid hex color (e.g., #ff0000)')
     else:
         prefs['bg_color'] = bg_color
@@ -135,7 +432,7 @@ def validate_prefs(form):
     text_color = form.get('text_color', '').strip().lower()
     if not text_color:
         errors.append('Text color is required')
-    elif not re.match(r'^#([0-9a-f]{6}|[0-9a-f]{3})$', text_color):
+    elif not HEX_COLOR_RE.match(text_color):
         errors.append('Text color must be a valid hex color (e.g., #000000)')
     else:
         prefs['text_color'] = text_color
@@ -156,20 +453,131 @@ def validate_prefs(form):
 
     return prefs, errors
 
-# Load chat history on startup
-load_chat_history()
+# Set MIGRATE_ON_STARTUP=0 to run migrate_users.py offline instead
+app.config['MIGRATE_ON_STARTUP'] = os.environ.get('MIGRATE_ON_STARTUP', '1') != '0'
+
+# Upgrade stored user records so handlers can assume a complete schema
+if app.config['MIGRATE_ON_STARTUP']:
+    startup_users = profile_startup('migrate_users', migrate_users)
+else:
+    startup_users = load_users()
+
+# Build the leaderboard index once; handlers keep it updated incrementally
+profile_startup('rebuild_leaderboard', rebuild_leaderboard, startup_users)
+del startup_users
+
+# Load chat history on startup. This stays at import rather than in the warm-up:
+# send_message saves the whole in-memory list, so a message arriving before a
+# deferred load would overwrite the stored history. The file is capped at 100
+# messages and its load time is reported in the startup profile.
+profile_startup('load_chat_history', load_chat_history)
+
+# --- Metrics ---
+
+def socketio_room_sizes():
+    """Member counts of the known Socket.IO rooms, sampled at scrape time"""
+    rooms = socketio.server.manager.rooms.get('/', {})
+    sizes = dict.fromkeys(METRICS_ROOMS + ('other',), 0)
+    for room, members in list(rooms.items()):
+        # Skip the implicit None room and each client's private room named after its sid
+        if room is None or room in members:
+            continue
+        # Keep label cardinality fixed and usernames out of the output
+        sizes[room if room in METRICS_ROOMS else 'other'] += len(members)
+    return [('socketio_room_members', {'room': room}, size) for room, size in sizes.items()]
+
+if metrics.enabled:
+    metrics.register_collector(socketio_room_sizes)
+
+    # Count every outgoing event; flask_socketio.emit and socketio.emit both end up here
+    _server_emit = socketio.server.emit
+
+    def counted_emit(event, *args, **kwargs):
+        metrics.inc('socketio_emits_total', event=event)
+        return _server_emit(event, *args, **kwargs)
+
+    socketio.server.emit = counted_emit
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        if 'request_start' in g:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe('http_request_seconds', time.perf_counter() - g.request_start,
+                            route=route, method=request.method, status=response.status_code)
+        return response
+
+def bearer_token_matches(token):
+    """Check the request's bearer token in constant time; an unset token matches nothing"""
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Only exposed when enabled and the scraper presents the configured token
+    if not metrics.enabled or not bearer_token_matches(app.config['METRICS_TOKEN']):
+        abort(404)
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# --- Profiling ---
+
+@app.before_request
+def start_profiling_sample():
+    if profiling.enabled:
+        profiling.begin('route:' + (request.url_rule.rule if request.url_rule else 'unmatched'))
+
+@app.teardown_request
+def end_profiling_sample(exc):
+    profiling.end()
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """Inspect or control the sampling profiler (requires PROFILING_TOKEN)"""
+    # Token rather than session based: sessions are only as secret as the signing key
+    if not bearer_token_matches(app.config['PROFILING_TOKEN']):
+        abort(404)
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        if not isinstance(data, Mapping):
+            return jsonify({'error': 'Request body must be a JSON object or form'}), 400
+        action = data.get('action')
+        if action == 'start':
+            try:
+                rate = float(data['sample_rate']) if 'sample_rate' in data else None
+                sample_interval = float(data['interval']) if 'interval' in data else None
+            except (TypeError, ValueError):
+                return jsonify({'error': 'sample_rate and interval must be numbers'}), 400
+            profiling.start(rate, sample_interval)
+        elif action == 'stop':
+            profiling.stop()
+        elif action == 'reset':
+            profiling.reset()
+        elif action == 'dump':
+            files = profiling.dump(app.config['PROFILE_DIR'])
+            return jsonify(dict(profiling.status(), files=files))
+        else:
+            return jsonify({'error': 'action must be one of start, stop, reset, dump'}), 400
+
+    return jsonify(profiling.status())
 
 # --- Public Routes ---
 
 @app.route('/')
+@cached_page
 def index():
     return render_template('index.html')
 
 @app.route('/welcome')
+@cached_page
 def welcome():
     return render_template('welcome.html')
 
 @app.route('/webcam')
+@cached_page
 def webcam():
     return render_template('webcam.html')
 
@@ -179,22 +587,27 @@ def platform():
     return render_template('platform.html', username=username)
 
 @app.route('/ptest3')
+@cached_page
 def ptest3():
     return render_template('ptest3.html')
 
 @app.route('/ptest2')
+@cached_page
 def ptest2():
     return render_template('ptest2.html')
 
 @app.route('/rtg')
+@cached_page
 def rtg():
     return render_template('rtg.html')
 
 @app.route('/ttg')
+@cached_page
 def ttg():
     return render_template('ttg.html')
 
 @app.route('/ideas')
+@cached_page
 def ideas():
     return render_template('ideas.html')
 
@@ -211,7 +624,7 @@ def signup():
         return redirect(url_for('index'))
 
     # Validate username (alphanumeric and underscores only, 3-20 chars)
-    if not re.match(r'^[a-zA-Z0-9_]{3,20}$', username):
+    if not USERNAME_RE.match(username):
         flash('Username must be 3-20 characters and contain only letters, numbers, and underscores', 'error')
         return redirect(url_for('index'))
 
@@ -223,18 +636,10 @@ def signup():
         return redirect(url_for('index'))
 
     # Save user data with initial clicker stats and default prefs
-    users[username] = {
-        'password': hash_password(password),
-        'gender': gender,
-        'clicks': 0,
-        'click_bonus': 1,
-        'has_unlocked_100': False,
-        'has_unlocked_1000': False,
-        'has_unlocked_10000': False,
-        'has_auto_clicker': False,
-        'prefs': get_default_prefs()
-    }
-    save_users(users)
+    users[username] = new_user_record(hash_password(password), gender)
+    # Only index the user once they are actually stored
+    if save_users(users):
+        update_leaderboard(username, 0)
 
     flash('Account created successfully! You can now sign in.', 'success')
     return redirect(url_for('welcome'))
@@ -307,7 +712,7 @@ def save_settings():
     # Get current background image before making changes
     users = load_users()
     current_bg_image = None
-    if username in users and 'prefs' in users[username]:
+    if username in users:
         current_bg_image = users[username]['prefs'].get('bg_image')
 
     # Process removal BEFORE upload (takes precedence)
@@ -363,9 +768,8 @@ def save_settings():
 
     # Save preferences
     if username not in users: # Safety check for concurrent operations
-        users[username] = {'prefs': {}}
-    if 'prefs' not in users[username]:
-        users[username]['prefs'] = {}
+        users[username] = {}
+        migrate_user(users[username])
 
     users[username]['prefs'].update(prefs)
     save_users(users)
@@ -375,7 +779,103 @@ def save_settings():
 
 # --- OpenCV Detection Route ---
 
+# Cascade files per detector: custom cascades first, then OpenCV's built-in ones
+CASCADE_CONFIGS = [
+    {'name': 'Face', 'paths': ['cascades/haarcascade_frontalface_alt2.xml',
+                               'cascades/face.xml'],
+     'builtin': ['haarcascade_frontalface_alt2.xml',
+                 'haarcascade_frontalface_default.xml'],
+     'color': '#10b981', 'params': {'scaleFactor': 1.05, 'minNeighbors': 6, 'minSize': (50, 50)}},
+
+    {'name': 'Hand', 'paths': ['cascades/hand.xml',
+                               'cascades/Hand.Cascade.1.xml',
+                               'cascades/palm.xml'],
+     'builtin': [],
+     'color': '#f59e0b', 'params': {'scaleFactor': 1.05, 'minNeighbors': 4, 'minSize': (40, 40)}}
+]
+
+# Idle loaded cascade sets. A classifier is not shared between concurrent
+# detections, so the pool grows to the peak number of detections in flight.
+cascade_pool = []
+cascade_pool_lock = threading.Lock()
+
+def load_cascades():
+    """Load one classifier per detector, or None where no cascade file loads"""
+    import cv2
+    loaded = []
+    for config in CASCADE_CONFIGS:
+        cascade = None
+        with metrics.timer('detect_cascade_load_seconds', cascade=config['name']):
+            for path in config['paths'] + [cv2.data.haarcascades + name for name in config['builtin']]:
+                # Rather than checking the file system, we rely on cv2 to try to load it.
+                test_cascade = cv2.CascadeClassifier(path)
+                if not test_cascade.empty():
+                    cascade = test_cascade
+                    break
+        loaded.append((config, cascade))
+    return loaded
+
+def acquire_cascades():
+    with cascade_pool_lock:
+        if cascade_pool:
+            return cascade_pool.pop()
+    return load_cascades()
+
+def release_cascades(cascades):
+    with cascade_pool_lock:
+        cascade_pool.append(cascades)
+
+def warm_up():
+    """Pay detection's cold-start costs: heavy imports, cascade parsing, first run"""
+    try:
+        cv2 = profile_startup('import_opencv', lambda: __import__('cv2'))
+        np = profile_startup('import_numpy', lambda: __import__('numpy'))
+        cascades = profile_startup('load_cascades', load_cascades)
+
+        # One detection on a blank frame so OpenCV's own lazy setup is done too
+        blank = np.zeros((120, 160), np.uint8)
+        def first_detection():
+            for config, cascade in cascades:
+                if cascade is not None:
+                    cascade.detectMultiScale(blank, flags=cv2.CASCADE_SCALE_IMAGE, **config['params'])
+        profile_startup('first_detection', first_detection)
+        release_cascades(cascades)
+    except ImportError:
+        # Detection is unavailable anyway, so there is nothing to warm
+        with warmup_lock:
+            startup_profile['opencv'] = 'not installed'
+    except Exception as e:
+        # Not ready: the first detection would still pay the cold-start cost
+        print(f"Warm-up error: {e}")
+        with warmup_lock:
+            warmup_state['status'] = 'failed'
+            warmup_state['error'] = str(e)
+        return
+    with warmup_lock:
+        warmup_state['status'] = 'ready'
+
+def start_warm_up():
+    """Run warm_up() once in the background"""
+    with warmup_lock:
+        if warmup_state['status'] != 'pending':
+            return
+        warmup_state['status'] = 'running'
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+if app.config['WARMUP_ON_STARTUP']:
+    start_warm_up()
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 until warm-up has finished (starting it if needed)"""
+    start_warm_up()
+    with warmup_lock:
+        body = dict(warmup_state, startup_profile=dict(startup_profile))
+    return jsonify(body), 200 if body['status'] == 'ready' else 503
+
+
 @app.route('/detect_objects', methods=['POST'])
+@rate_limited('detect', detect_in_flight, 'DETECT_MAX_IN_FLIGHT')
 def detect_objects():
     """Process webcam frame and detect objects using OpenCV"""
     try:
@@ -399,20 +899,6 @@ def detect_objects():
         if frame is None:
             return jsonify({'error': 'Failed to decode image'}), 400
 
-        # Define cascade paths (custom cascades first, then fallback to built-in)
-        cascade_configs = [
-            {'name': 'Face', 'paths': ['cascades/haarcascade_frontalface_alt2.xml',  
-                                       'cascades/face.xml',
-                                       cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml',
-                                       cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'],
-             'color': '#10b981', 'params': {'scaleFactor': 1.05, 'minNeighbors': 6, 'minSize': (50, 50)}},
-
-            {'name': 'Hand', 'paths': ['cascades/hand.xml',
-                                       'cascades/Hand.Cascade.1.xml',
-                                       'cascades/palm.xml'],
-             'color': '#f59e0b', 'params': {'scaleFactor': 1.05, 'minNeighbors': 4, 'minSize': (40, 40)}}
-        ]
-
         # Convert to grayscale and enhance image quality
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         gray = cv2.equalizeHist(gray)
@@ -421,28 +907,21 @@ def detect_objects():
         # Prepare detection results
         detections = []
 
-        # Try each cascade configuration
-        for config in cascade_configs:
-            cascade = None
-
-            # Try each path until one loads successfully
-            for path in config['paths']:
-                # The path check is simplified here as we cannot reliably check file system
-                # Instead, we rely on cv2 to try to load it.
-                test_cascade = cv2.CascadeClassifier(path)
-                if not test_cascade.empty():
-                    cascade = test_cascade
-                    break
-
-            # If cascade loaded, perform detection
-            if cascade is not None and not cascade.empty():
-                objects = cascade.detectMultiScale(
-                    gray,
-                    scaleFactor=config['params']['scaleFactor'],
-                    minNeighbors=config['params']['minNeighbors'],
-                    minSize=config['params']['minSize'],
-                    flags=cv2.CASCADE_SCALE_IMAGE
-                )
+        # Borrow a loaded set of cascades and run each detector that has one
+        cascades = acquire_cascades()
+        try:
+            for config, cascade in cascades:
+                if cascade is None:
+                    continue
+
+                with metrics.timer('detect_multiscale_seconds', cascade=config['name']):
+                    objects = cascade.detectMultiScale(
+                        gray,
+                        scaleFactor=config['params']['scaleFactor'],
+                        minNeighbors=config['params']['minNeighbors'],
+                        minSize=config['params']['minSize'],
+                        flags=cv2.CASCADE_SCALE_IMAGE
+                    )
 
                 # Add detections
                 for (x, y, w, h) in objects:
@@ -457,6 +936,8 @@ def detect_objects():
                             'height': int(h)
                         }
                     })
+        finally:
+            release_cascades(cascades)
 
         return jsonify({
             'detections': detections,
@@ -464,8 +945,10 @@ def detect_objects():
         })
 
     except ImportError:
+        metrics.inc('detect_errors_total', reason='import')
         return jsonify({'error': 'OpenCV (cv2) not installed. Cannot perform object detection.'}), 500
     except Exception as e:
+        metrics.inc('detect_errors_total', reason=type(e).__name__)
         print(f"Detection error: {e}")
         return jsonify({'error': str(e)}), 500
 
@@ -481,22 +964,7 @@ def clicker():
     users = load_users()
     username = session['username']
 
-    # Initialize clicks if not present (for existing users who didn't go through new signup)
-    # This ensures backward compatibility for older user data.
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'click_bonus' not in users[username]:
-        users[username]['click_bonus'] = 1
-    if 'has_unlocked_100' not in users[username]:
-        users[username]['has_unlocked_100'] = False
-    if 'has_unlocked_1000' not in users[username]:
-        users[username]['has_unlocked_1000'] = False
-    if 'has_unlocked_10000' not in users[username]:
-        users[username]['has_unlocked_10000'] = False
-    if 'has_auto_clicker' not in users[username]:
-        users[username]['has_auto_clicker'] = False
-    save_users(users)
-
+    # Records are complete here: older data is backfilled by migrate_users() at startup
     current_clicks = users[username]['clicks']
     current_bonus = users[username]['click_bonus']
     has_unlocked_100 = users[username]['has_unlocked_100']
@@ -514,6 +982,7 @@ def clicker():
                            has_auto_clicker=has_auto_clicker)
 
 @app.route('/save_click', methods=['POST'])
+@rate_limited('click', storage_in_flight, 'STORAGE_MAX_IN_FLIGHT')
 def save_click():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -521,19 +990,16 @@ def save_click():
     users = load_users()
     username = session['username']
 
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'click_bonus' not in users[username]:
-        users[username]['click_bonus'] = 1
-
     # Increment click count by the current bonus amount
     bonus = users[username]['click_bonus']
     users[username]['clicks'] += bonus
-    save_users(users)
+    rank = update_leaderboard(username, users[username]['clicks']) if save_users(users) else None
 
-    return jsonify({'clicks': users[username]['clicks'], 'click_bonus': bonus})
+    return jsonify({'clicks': users[username]['clicks'], 'click_bonus': bonus,
+                    'rank': rank})
 
 @app.route('/spend_clicks', methods=['POST'])
+@rate_limited('upgrade', storage_in_flight, 'STORAGE_MAX_IN_FLIGHT')
 def spend_clicks():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -542,13 +1008,6 @@ def spend_clicks():
     username = session['username']
     SPEND_AMOUNT = 10
 
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'click_bonus' not in users[username]:
-        users[username]['click_bonus'] = 1
-    if 'has_unlocked_100' not in users[username]:
-        users[username]['has_unlocked_100'] = False
-
     current_clicks = users[username]['clicks']
 
     if current_clicks < SPEND_AMOUNT:
@@ -562,7 +1021,8 @@ def spend_clicks():
     users[username]['clicks'] -= SPEND_AMOUNT
     users[username]['click_bonus'] += 1
     users[username]['has_unlocked_100'] = True
-    save_users(users)
+    if save_users(users):
+        update_leaderboard(username, users[username]['clicks'])
 
     return jsonify({
         'clicks': users[username]['clicks'],
@@ -571,6 +1031,7 @@ def spend_clicks():
     })
 
 @app.route('/spend_clicks_100', methods=['POST'])
+@rate_limited('upgrade', storage_in_flight, 'STORAGE_MAX_IN_FLIGHT')
 def spend_clicks_100():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -579,15 +1040,6 @@ def spend_clicks_100():
     username = session['username']
     SPEND_AMOUNT = 100
 
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'click_bonus' not in users[username]:
-        users[username]['click_bonus'] = 1
-    if 'has_unlocked_100' not in users[username]:
-        users[username]['has_unlocked_100'] = False
-    if 'has_unlocked_1000' not in users[username]:
-        users[username]['has_unlocked_1000'] = False
-
     current_clicks = users[username]['clicks']
 
     if not users[username]['has_unlocked_100']:
@@ -609,7 +1061,8 @@ def spend_clicks_100():
     users[username]['clicks'] -= SPEND_AMOUNT
     users[username]['click_bonus'] += 10
     users[username]['has_unlocked_1000'] = True
-    save_users(users)
+    if save_users(users):
+        update_leaderboard(username, users[username]['clicks'])
 
     return jsonify({
         'clicks': users[username]['clicks'],
@@ -619,6 +1072,7 @@ def spend_clicks_100():
     })
 
 @app.route('/spend_clicks_1000', methods=['POST'])
+@rate_limited('upgrade', storage_in_flight, 'STORAGE_MAX_IN_FLIGHT')
 def spend_clicks_1000():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -627,15 +1081,6 @@ def spend_clicks_1000():
     username = session['username']
     SPEND_AMOUNT = 1000
 
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'click_bonus' not in users[username]:
-        users[username]['click_bonus'] = 1
-    if 'has_unlocked_1000' not in users[username]:
-        users[username]['has_unlocked_1000'] = False
-    if 'has_unlocked_10000' not in users[username]:
-        users[username]['has_unlocked_10000'] = False
-
     current_clicks = users[username]['clicks']
 
     if not users[username]['has_unlocked_1000']:
@@ -659,7 +1104,8 @@ def spend_clicks_1000():
     users[username]['clicks'] -= SPEND_AMOUNT
     users[username]['click_bonus'] += 100
     users[username]['has_unlocked_10000'] = True
-    save_users(users)
+    if save_users(users):
+        update_leaderboard(username, users[username]['clicks'])
 
     return jsonify({
         'clicks': users[username]['clicks'],
@@ -670,6 +1116,7 @@ def spend_clicks_1000():
     })
 
 @app.route('/spend_clicks_10000', methods=['POST'])
+@rate_limited('upgrade', storage_in_flight, 'STORAGE_MAX_IN_FLIGHT')
 def spend_clicks_10000():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -678,13 +1125,6 @@ def spend_clicks_10000():
     username = session['username']
     SPEND_AMOUNT = 10000
 
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'click_bonus' not in users[username]:
-        users[username]['click_bonus'] = 1
-    if 'has_unlocked_10000' not in users[username]:
-        users[username]['has_unlocked_10000'] = False
-
     current_clicks = users[username]['clicks']
 
     if not users[username]['has_unlocked_10000']:
@@ -709,7 +1149,8 @@ def spend_clicks_10000():
 
     users[username]['clicks'] -= SPEND_AMOUNT
     users[username]['click_bonus'] += 1000
-    save_users(users)
+    if save_users(users):
+        update_leaderboard(username, users[username]['clicks'])
 
     return jsonify({
         'clicks': users[username]['clicks'],
@@ -720,6 +1161,7 @@ def spend_clicks_10000():
     })
 
 @app.route('/unlock_auto_clicker', methods=['POST'])
+@rate_limited('upgrade', storage_in_flight, 'STORAGE_MAX_IN_FLIGHT')
 def unlock_auto_clicker():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
@@ -728,13 +1170,6 @@ def unlock_auto_clicker():
     username = session['username']
     SPEND_AMOUNT = 15000
 
-    if 'clicks' not in users[username]:
-        users[username]['clicks'] = 0
-    if 'has_unlocked_10000' not in users[username]:
-        users[username]['has_unlocked_10000'] = False
-    if 'has_auto_clicker' not in users[username]:
-        users[username]['has_auto_clicker'] = False
-
     current_clicks = users[username]['clicks']
 
     if not users[username]['has_unlocked_10000']:
@@ -760,27 +1195,47 @@ def unlock_auto_clicker():
 
     users[username]['clicks'] -= SPEND_AMOUNT
     users[username]['has_auto_clicker'] = True
-    save_users(users)
+    if save_users(users):
+        update_leaderboard(username, users[username]['clicks'])
 
     return jsonify({
         'clicks': users[username]['clicks'],
         'has_auto_clicker': users[username]['has_auto_clicker']
     })
 
+@app.route('/leaderboard')
+def get_leaderboard():
+    """Top players, plus the caller's rank and neighbors when signed in"""
+    limit = min(request.args.get('limit', LEADERBOARD_SIZE, type=int), 100)
+    with leaderboard_lock:
+        result = {'top': get_leaderboard_entries(0, max(limit, 0))}
+        username = session.get('username')
+        rank = get_rank(username) if username else None
+        if rank is not None:
+            result['rank'] = rank
+            result['neighbors'] = get_leaderboard_entries(max(rank - 3, 0), rank + 2)
+    return jsonify(result)
+
 
 # --- WebSocket Event Handlers for Multiplayer Chat/Platformer ---
 
 @socketio.on('connect')
 def handle_connect():
+    metrics.inc('socketio_connects_total')
+    metrics.add_gauge('socketio_connections_active', 1)
     if 'username' in session:
         emit('user_connected', {'username': session['username']}, broadcast=True)
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    metrics.add_gauge('socketio_connections_active', -1)
+    leaderboard_watchers.pop(request.sid, None)
     if 'username' in session:
         emit('user_disconnected', {'username': session['username']}, broadcast=True)
 
 @socketio.on('join_room')
+@metrics.timed('socketio_event_seconds', event='join_room')
+@profiling.profiled('event:join_room')
 def handle_join_room(data):
     if 'username' in session:
         room = data.get('room', 'default')
@@ -797,6 +1252,8 @@ def handle_join_room(data):
         }, room=unified_room)
 
 @socketio.on('leave_room')
+@metrics.timed('socketio_event_seconds', event='leave_room')
+@profiling.profiled('event:leave_room')
 def handle_leave_room(data):
     if 'username' in session:
         room = data.get('room', 'default')
@@ -809,6 +1266,8 @@ def handle_leave_room(data):
         }, room=unified_room)
 
 @socketio.on('send_message')
+@metrics.timed('socketio_event_seconds', event='send_message')
+@profiling.profiled('event:send_message')
 def handle_message(data):
     if 'username' in session:
         room = data.get('room', 'default')
@@ -834,6 +1293,8 @@ def handle_message(data):
         emit('receive_message', message_data, room=unified_room)
 
 @socketio.on('user_action')
+@metrics.timed('socketio_event_seconds', event='user_action')
+@profiling.profiled('event:user_action')
 def handle_user_action(data):
     if 'username' in session:
         room = data.get('room', 'default')
@@ -846,6 +1307,29 @@ def handle_user_action(data):
             'data': data.get('data', {})
         }, room=unified_room, include_self=False)
 
+@socketio.on('watch_leaderboard')
+@metrics.timed('socketio_event_seconds', event='watch_leaderboard')
+@profiling.profiled('event:watch_leaderboard')
+def handle_watch_leaderboard():
+    # Top-N updates go to everyone watching; rank updates only to the player
+    join_room('leaderboard')
+    if 'username' in session:
+        join_room(f"leaderboard_{session['username']}")
+        leaderboard_watchers[request.sid] = session['username']
+    start_leaderboard_pusher()
+    with leaderboard_lock:
+        top = get_leaderboard_entries(0, LEADERBOARD_SIZE)
+        rank = get_rank(session['username']) if 'username' in session else None
+    emit('leaderboard_update', {'top': top})
+    if rank is not None:
+        emit('rank_update', {'rank': rank})
+
+
+# Render the cached public pages once per deploy. This must stay below every
+# route: templates link to other endpoints with url_for, which fails for any
+# endpoint not registered yet.
+prerender_pages()
+
 
 if __name__ == '__main__':
     # Using socketio.run instead of app.run for Flask-SocketIO apps
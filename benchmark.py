@@ -0,0 +1,315 @@
+"""Local load-testing and benchmark suite for the app's hot paths.
+
+Drives the app in-process through the Flask and Socket.IO test clients, so
+nothing listens on a port and no real data is touched (every run works in
+a fresh temporary directory).
+
+Usage:
+    python benchmark.py                              # all scenarios, default sizes
+    python benchmark.py --users 50 --output run.json
+    python benchmark.py --compare before.json        # show deltas vs an earlier run
+
+Scenarios:
+    click_storm  every user hammers /save_click
+    upgrades     every user buys the whole upgrade chain
+    chat_flood   every user sends chat messages over Socket.IO
+    detection    frames from bench_frames/ (or generated ones) posted to /detect_objects
+
+Each scenario runs in its own subprocess and scratch directory, so peak RSS
+is that scenario's own. Each reports throughput and p50/p99 latency of
+successful operations, plus its error count; non-2xx responses are errors
+and make the run exit non-zero. Results are written as JSON together with
+the current git commit so runs can be compared.
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from storage import DEFAULT_FORMAT  # noqa: E402
+FRAMES_DIR = os.path.join(REPO_DIR, 'bench_frames')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def summarize(name, latencies, errors, elapsed):
+    operations = len(latencies) + errors
+    return {
+        'scenario': name,
+        'operations': operations,
+        'errors': errors,
+        'error_rate': round(errors / operations, 4) if operations else 0,
+        'seconds': round(elapsed, 4),
+        # Throughput and latency cover successful operations only, so failing
+        # fast never looks like a speedup
+        'ops_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def timed_calls(calls):
+    """Run callables in order; returns successful latencies, error count and total time.
+
+    A call fails if it returns a response with a non-2xx status. Socket.IO
+    emits return None and count as successes.
+    """
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for call in calls:
+        t0 = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - t0
+        if response is not None and not 200 <= response.status_code < 300:
+            errors += 1
+        else:
+            latencies.append(elapsed)
+    return latencies, errors, time.perf_counter() - start
+
+
+def make_png(width, height, seed):
+    """Encode a grayscale noise-and-gradient PNG using only the stdlib"""
+    rng = random.Random(seed)
+    rows = b''.join(
+        b'\x00' + bytes((x * 255 // width + rng.randrange(32)) % 256 for x in range(width))
+        for _ in range(height)
+    )
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def load_frames(count):
+    """Sample frames from bench_frames/ if present, else generated ones"""
+    if os.path.isdir(FRAMES_DIR):
+        names = sorted(n for n in os.listdir(FRAMES_DIR)
+                       if n.rsplit('.', 1)[-1].lower() in ('png', 'jpg', 'jpeg'))
+        if names:
+            frames = []
+            for name in names:
+                with open(os.path.join(FRAMES_DIR, name), 'rb') as f:
+                    frames.append(f.read())
+            return frames
+    return [make_png(320, 240, seed) for seed in range(count)]
+
+
+def signed_in_client(app_module, username):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['username'] = username
+    return client
+
+
+def create_users(app_module, count, clicks=0):
+    users = app_module.load_users()
+    names = [f'bench_user_{i}' for i in range(count)]
+    for name in names:
+        users[name] = app_module.new_user_record(app_module.hash_password('bench'), 'other')
+        users[name]['clicks'] = clicks
+    app_module.save_users(users)
+    app_module.rebuild_leaderboard(users)
+    return names
+
+
+def bench_click_storm(app_module, args):
+    names = create_users(app_module, args.users)
+    clients = [signed_in_client(app_module, name) for name in names]
+    calls = [lambda c=c: c.post('/save_click') for _ in range(args.clicks) for c in clients]
+    return timed_calls(calls)
+
+
+def bench_upgrades(app_module, args):
+    names = create_users(app_module, args.users, clicks=10 ** 9)
+    clients = [signed_in_client(app_module, name) for name in names]
+    chain = ['/spend_clicks', '/spend_clicks_100', '/spend_clicks_1000',
+             '/spend_clicks_10000', '/unlock_auto_clicker']
+    calls = [lambda c=c, r=r: c.post(r) for c in clients for r in chain]
+    return timed_calls(calls)
+
+
+def bench_chat_flood(app_module, args):
+    names = create_users(app_module, args.users)
+    sockets = []
+    for name in names:
+        client = signed_in_client(app_module, name)
+        sock = app_module.socketio.test_client(app_module.app, flask_test_client=client)
+        sock.emit('join_room', {'room': 'default'})
+        sockets.append(sock)
+    calls = [lambda s=s, i=i: s.emit('send_message', {'room': 'default', 'message': f'message {i}'})
+             for i in range(args.messages) for s in sockets]
+    result = timed_calls(calls)
+    for sock in sockets:
+        sock.disconnect()
+    return result
+
+
+def bench_detection(app_module, args):
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        print('  skipped: OpenCV (cv2) not installed')
+        return None
+    import base64
+    client = app_module.app.test_client()
+    payloads = [{'image': 'data:image/png;base64,' + base64.b64encode(frame).decode()}
+                for frame in load_frames(args.frames)]
+    calls = [lambda p=p: client.post('/detect_objects', json=p) for p in payloads]
+    return timed_calls(calls)
+
+
+SCENARIOS = {
+    'click_storm': bench_click_storm,
+    'upgrades': bench_upgrades,
+    'chat_flood': bench_chat_flood,
+    'detection': bench_detection,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)['results']}
+    print(f'\nCompared with {baseline_path}:')
+    for result in results:
+        old = baseline.get(result['scenario'])
+        if not old:
+            continue
+        deltas = []
+        for key in ('ops_per_second', 'p50_ms', 'p99_ms'):
+            if old.get(key) and result.get(key) is not None:
+                deltas.append(f'{key} {100 * (result[key] - old[key]) / old[key]:+.1f}%')
+        deltas.append(f"error_rate {old.get('error_rate', 0)} -> {result['error_rate']}")
+        print(f"  {result['scenario']:<12} " + ', '.join(deltas))
+
+
+def run_worker(name, args, output):
+    """Run one scenario in this process and write its result to `output`"""
+    random.seed(args.seed)
+    # Measure the handlers themselves, not the per-user request budgets
+    # (overload shedding stays on; it has its own LOAD_SHEDDING_ENABLED flag)
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    # The app reads and writes relative paths, so run it inside a scratch directory
+    with tempfile.TemporaryDirectory(prefix='app-bench-') as workdir:
+        os.chdir(workdir)
+        try:
+            import app as app_module
+            outcome = SCENARIOS[name](app_module, args)
+            result = summarize(name, *outcome) if outcome is not None else None
+        finally:
+            # Leave the directory so it can be removed
+            os.chdir(REPO_DIR)
+    with open(output, 'w') as f:
+        json.dump(result, f)
+
+
+def run_scenario(name, argv):
+    """Run a scenario in a fresh subprocess so its peak memory is its own"""
+    with tempfile.TemporaryDirectory(prefix='app-bench-result-') as tmp:
+        output = os.path.join(tmp, 'result.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), name, *argv,
+                        '--worker-output', output], check=True)
+        with open(output) as f:
+            return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the app hot paths locally')
+    parser.add_argument('scenarios', nargs='*',
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--users', type=int, default=20, help='simulated users')
+    parser.add_argument('--clicks', type=int, default=50, help='clicks per user in click_storm')
+    parser.add_argument('--messages', type=int, default=20, help='messages per user in chat_flood')
+    parser.add_argument('--frames', type=int, default=10, help='generated frames when bench_frames/ is empty')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--compare', help='JSON results from an earlier run to compare against')
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    if args.worker_output:
+        run_worker(args.scenarios[0], args, args.worker_output)
+        return 0
+
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+    # Sizing options are forwarded unchanged to each scenario's subprocess
+    worker_argv = [f'--{key}={value}' for key, value in vars(args).items()
+                   if key in ('users', 'clicks', 'messages', 'frames', 'seed')]
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        print(f'Running {name}...')
+        result = run_scenario(name, worker_argv)
+        if result is None:
+            continue
+        results.append(result)
+        print(f"  {result['operations']} ops, {result['errors']} errors, "
+              f"{result['ops_per_second']} ops/s, p50 {result['p50_ms']} ms, "
+              f"p99 {result['p99_ms']} ms, peak RSS {result['peak_rss_kb']} KB")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'storage_format': DEFAULT_FORMAT,
+        'parameters': {k: v for k, v in vars(args).items()
+                       if k not in ('output', 'compare', 'scenarios', 'worker_output')},
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {output}')
+    if compare:
+        print_comparison(results, compare)
+    failed = [r['scenario'] for r in results if r['errors']]
+    if failed:
+        print(f"Errors in: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
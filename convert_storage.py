@@ -0,0 +1,33 @@
+"""Convert persisted users/chat files between storage formats.
+
+Usage:
+    python convert_storage.py msgpack              # convert users + chat history
+    python convert_storage.py json users.json      # convert specific files
+
+Files are rewritten in place; the app auto-detects the format on load.
+"""
+import argparse
+import sys
+
+from storage import SERIALIZERS, USERS_FILE, CHAT_HISTORY_FILE, read_data_file, write_data_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert stored app data between formats')
+    parser.add_argument('format', choices=sorted(SERIALIZERS), help='target storage format')
+    parser.add_argument('files', nargs='*', default=[USERS_FILE, CHAT_HISTORY_FILE],
+                        help='files to convert (default: users and chat history)')
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        data = read_data_file(path, None)
+        if data is None:
+            print(f"Skipping {path}: missing or empty")
+            continue
+        write_data_file(path, data, args.format)
+        print(f"Converted {path} to {args.format}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
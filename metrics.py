@@ -0,0 +1,130 @@
+"""Lightweight in-process metrics rendered in Prometheus text format.
+
+Everything here is a no-op until `enabled` is set to True. `timed()` is
+resolved when a function is decorated, so with metrics disabled the
+decorated function is returned unchanged and costs nothing per call.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+
+enabled = False
+
+# Latency buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # name -> {labels: [per-bucket counts..., +Inf count, sum]}
+_counters = {}    # name -> {labels: value}
+_gauges = {}      # name -> {labels: value}
+_collectors = []  # callables returning [(name, labels dict, value)] gauge samples at scrape time
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """Record one latency sample in a histogram"""
+    if not enabled:
+        return
+    with _lock:
+        series = _histograms.setdefault(name, {}).get(_key(labels))
+        if series is None:
+            series = _histograms[name][_key(labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+        series[bisect_left(BUCKETS, seconds)] += 1
+        series[-1] += seconds
+
+
+def inc(name, amount=1, **labels):
+    """Increase a monotonic counter"""
+    if not enabled:
+        return
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[_key(labels)] = series.get(_key(labels), 0) + amount
+
+
+def add_gauge(name, amount, **labels):
+    """Move a gauge up or down"""
+    if not enabled:
+        return
+    with _lock:
+        series = _gauges.setdefault(name, {})
+        series[_key(labels)] = series.get(_key(labels), 0) + amount
+
+
+def register_collector(collector):
+    """Add a callable sampled only when /metrics is scraped"""
+    _collectors.append(collector)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Time a block into a histogram"""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator timing every call into a histogram (identity when disabled)"""
+    def decorator(func):
+        if not enabled:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        histograms = {name: {k: list(v) for k, v in series.items()} for name, series in _histograms.items()}
+        counters = {name: dict(series) for name, series in _counters.items()}
+        gauges = {name: dict(series) for name, series in _gauges.items()}
+
+    for collector in _collectors:
+        for name, labels, value in collector():
+            gauges.setdefault(name, {})[_key(labels)] = value
+
+    for name, series in sorted(histograms.items()):
+        lines.append(f'# TYPE {name} histogram')
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    for kind, metrics in (('counter', counters), ('gauge', gauges)):
+        for name, series in sorted(metrics.items()):
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
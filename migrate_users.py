@@ -0,0 +1,26 @@
+"""Upgrade stored user records to the current schema.
+
+Usage:
+    python migrate_users.py                # migrate offline...
+    MIGRATE_ON_STARTUP=0 python app.py    # ...then serve without the startup pass
+
+Only touches the users file; it does not import app.py or run its startup work.
+"""
+import sys
+
+from storage import (USERS_FILE, USER_SCHEMA_VERSION, DEFAULT_FORMAT, check_format,
+                     migrate_records, read_data_file, write_data_file)
+
+
+def main():
+    fmt = check_format(DEFAULT_FORMAT)
+    users = read_data_file(USERS_FILE, {})
+    migrated = migrate_records(users)
+    if migrated:
+        write_data_file(USERS_FILE, users, fmt)
+    print(f"Migrated {migrated} user record(s) to schema v{USER_SCHEMA_VERSION}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
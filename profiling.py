@@ -0,0 +1,134 @@
+"""Opt-in sampling profiler producing collapsed stacks for flame graphs.
+
+A fraction of requests/Socket.IO events (`sample_rate`) is marked while it
+runs; a background thread periodically snapshots the stacks of marked
+threads. dump() writes one `<label>.collapsed` file per route/event plus
+`all.collapsed`, ready for flamegraph.pl or speedscope.
+
+Profiling can be started and stopped at any time without a restart.
+While stopped, begin() is a single attribute check.
+"""
+from collections import Counter
+from functools import wraps
+import os
+import random
+import re
+import sys
+import threading
+
+enabled = False
+sample_rate = 0.01
+interval = 0.005  # Seconds between stack snapshots
+
+_lock = threading.Lock()
+_control_lock = threading.Lock()  # Serializes start()/stop() so only one sampler runs
+_active = {}        # thread ident -> label of the sampled request/event it is running
+_stacks = Counter()  # 'label;frame;frame;...' -> samples
+_stop_event = None
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample_loop(stop_event):
+    me = threading.get_ident()
+    while not stop_event.wait(interval):
+        if not _active:
+            continue
+        frames = sys._current_frames()
+        with _lock:
+            for ident, label in list(_active.items()):
+                frame = frames.get(ident)
+                if frame is not None and ident != me:
+                    _stacks[f'{label};{_collapse(frame)}'] += 1
+
+
+def start(rate=None, sample_interval=None):
+    """Start sampling (or update the rate/interval if already running)"""
+    global enabled, sample_rate, interval, _stop_event
+    with _control_lock:
+        if rate is not None:
+            sample_rate = max(0.0, min(1.0, rate))
+        if sample_interval is not None:
+            interval = max(0.001, sample_interval)
+        if enabled:
+            return
+        _stop_event = threading.Event()
+        threading.Thread(target=_sample_loop, args=(_stop_event,), name='profiling-sampler', daemon=True).start()
+        enabled = True
+
+
+def stop():
+    """Stop sampling; collected stacks are kept until reset()"""
+    global enabled
+    with _control_lock:
+        enabled = False
+        if _stop_event is not None:
+            _stop_event.set()
+        _active.clear()
+
+
+def reset():
+    with _lock:
+        _stacks.clear()
+
+
+def begin(label):
+    """Mark the current thread as running a sampled unit of work"""
+    if enabled and random.random() < sample_rate:
+        _active[threading.get_ident()] = label
+
+
+def end():
+    _active.pop(threading.get_ident(), None)
+
+
+def profiled(label):
+    """Decorator sampling calls under the given label while profiling is on"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            begin(label)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end()
+        return wrapper
+    return decorator
+
+
+def status():
+    with _lock:
+        labels = Counter()
+        for stack, count in _stacks.items():
+            labels[stack.split(';', 1)[0]] += count
+    return {'enabled': enabled, 'sample_rate': sample_rate, 'interval': interval,
+            'samples': dict(labels)}
+
+
+def dump(directory):
+    """Write collapsed-stack files; returns the paths written"""
+    with _lock:
+        stacks = dict(_stacks)
+    by_label = {}
+    for stack, count in stacks.items():
+        by_label.setdefault(stack.split(';', 1)[0], []).append((stack, count))
+
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for label, entries in sorted(by_label.items()) + [('all', list(stacks.items()))]:
+        filename = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'root'
+        path = os.path.join(directory, f'{filename}.collapsed')
+        with open(path, 'w') as f:
+            for stack, count in sorted(entries):
+                f.write(f'{stack} {count}\n')
+        written.append(path)
+    return written
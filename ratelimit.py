@@ -0,0 +1,79 @@
+"""In-process token-bucket rate limiting and in-flight tracking for load shedding."""
+from contextlib import ContextDecorator
+import math
+import threading
+import time
+
+# Drop idle buckets once this many keys are tracked
+MAX_TRACKED_KEYS = 10000
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets for a set of named budgets.
+
+    budgets maps a budget name to (tokens refilled per second, burst size).
+    """
+
+    def __init__(self, budgets):
+        self.budgets = budgets
+        self._buckets = {}  # (budget, key) -> [tokens, last refill time]
+        self._lock = threading.Lock()
+
+    def acquire(self, budget, key):
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        rate, burst = self.budgets[budget]
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((budget, key))
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_KEYS:
+                    self._prune(now)
+                bucket = self._buckets[(budget, key)] = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def _prune(self, now):
+        # A bucket that has refilled completely carries no state worth keeping
+        for (budget, key), (tokens, last) in list(self._buckets.items()):
+            rate, burst = self.budgets[budget]
+            if tokens + (now - last) * rate >= burst:
+                del self._buckets[(budget, key)]
+
+
+class InFlight(ContextDecorator):
+    """Counts concurrent executions of a block or function (a queue-depth signal)"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.count += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.leave()
+
+    def try_enter(self, limit):
+        """Enter only if fewer than `limit` are running; returns whether it did"""
+        with self._lock:
+            if self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def leave(self):
+        """Undo a successful try_enter()"""
+        with self._lock:
+            self.count -= 1
+
+
+def retry_after_header(seconds):
+    """Retry-After takes whole seconds; never ask clients to retry instantly"""
+    return str(max(1, math.ceil(seconds)))
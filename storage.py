@@ -0,0 +1,153 @@
+"""Serializers and the user-record schema for the persisted users/chat files.
+
+Kept free of Flask and app state so offline tools (convert_storage.py,
+migrate_users.py) can read and write data without importing app.py and
+running its startup work.
+"""
+import json
+import os
+import tempfile
+
+# msgpack is optional; without it persisted state falls back to compact JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# File to store user data
+USERS_FILE = 'users.json'
+CHAT_HISTORY_FILE = 'chat_history.json'
+
+
+def _json_dumps(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(raw):
+    return json.loads(raw.decode('utf-8'))
+
+
+# Serializer registry: format name -> (dumps, loads) working on bytes
+SERIALIZERS = {'json': (_json_dumps, _json_loads)}
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = (
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda raw: msgpack.unpackb(raw, raw=False),
+    )
+
+# Format used for writes. JSON unless STORAGE_FORMAT=msgpack is set explicitly:
+# older releases can only read JSON, so msgpack must be opted into (and files
+# converted back with convert_storage.py json before rolling back).
+DEFAULT_FORMAT = os.environ.get('STORAGE_FORMAT', 'json')
+
+
+def check_format(fmt):
+    """Fail fast on an unknown or uninstalled format instead of dropping writes later"""
+    if fmt not in SERIALIZERS:
+        raise RuntimeError(f"Storage format {fmt!r} is not available "
+                           f"(choose from: {', '.join(sorted(SERIALIZERS))})")
+    return fmt
+
+
+def detect_format(raw):
+    """Guess which serializer wrote a stored file from its first byte"""
+    # Our files always hold a dict or list: JSON starts with '{' or '[',
+    # msgpack maps/arrays start with a byte >= 0x80
+    if raw.lstrip()[:1] in (b'{', b'['):
+        return 'json'
+    return 'msgpack'
+
+
+def read_data_file(path, default):
+    """Read a persisted file in whichever format it was written"""
+    if not os.path.exists(path):
+        return default
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if not raw.strip():
+        return default
+    fmt = detect_format(raw)
+    if fmt not in SERIALIZERS:
+        # Not a ValueError: callers must not treat this as a corrupt file and overwrite it
+        raise RuntimeError(f"{path} is stored as {fmt}, which is not installed")
+    return SERIALIZERS[fmt][1](raw)
+
+
+def _file_mode(path):
+    try:
+        return os.stat(path).st_mode & 0o777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_data_file(path, data, fmt):
+    """Write a persisted file in the given format, atomically"""
+    raw = SERIALIZERS[fmt][0](data)
+    # Write a sibling temp file and swap it in, so an interrupted write never
+    # leaves a truncated file that readers would take for empty data
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # mkstemp creates 0600 files; keep the mode a plain open() would give
+            os.fchmod(f.fileno(), _file_mode(path))
+            f.write(raw)
+            f.flush()  # Ensure data is written to disk
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_default_prefs():
+    """Get default user preferences"""
+    return {
+        'welcome_text': 'Welcome to the website made by your ideas!',
+        'bg_color': '#f5f5f5',
+        'text_color': '#333333',
+        'font_size': '16',
+        'bg_image': None
+    }
+
+
+# Bump USER_SCHEMA_VERSION and extend migrate_user() whenever the record layout changes
+USER_SCHEMA_VERSION = 1
+
+# Clicker fields every user record is guaranteed to have after migration
+CLICKER_DEFAULTS = {
+    'clicks': 0,
+    'click_bonus': 1,
+    'has_unlocked_100': False,
+    'has_unlocked_1000': False,
+    'has_unlocked_10000': False,
+    'has_auto_clicker': False,
+}
+
+
+def new_user_record(password_hash, gender):
+    """Build a complete, current-schema record for a new user"""
+    record = {'password': password_hash, 'gender': gender}
+    record.update(CLICKER_DEFAULTS)
+    record['prefs'] = get_default_prefs()
+    record['schema_version'] = USER_SCHEMA_VERSION
+    return record
+
+
+def migrate_user(record):
+    """Upgrade one user record in place; returns True if it changed"""
+    if record.get('schema_version', 0) >= USER_SCHEMA_VERSION:
+        return False
+    # v0 -> v1: backfill clicker stats and prefs for users created before they existed
+    for key, value in CLICKER_DEFAULTS.items():
+        record.setdefault(key, value)
+    record.setdefault('prefs', get_default_prefs())
+    record['schema_version'] = USER_SCHEMA_VERSION
+    return True
+
+
+def migrate_records(users):
+    """Upgrade every record in a users dict; returns how many changed"""
+    return sum(migrate_user(record) for record in users.values())